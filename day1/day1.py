@@ -4,11 +4,18 @@
 #
 from typing import Sequence, Union, Optional, Any, Dict, List, Tuple
 from pathlib import Path
-from collections import defaultdict
+from collections import defaultdict, Counter
 from dataclasses import dataclass
 from pprint import pprint
+from itertools import islice
+import heapq
 import math
 import re
+import sys
+import tempfile
+import time
+
+import numpy as np
 
 INPUTFILE = "input.txt"
 
@@ -85,28 +92,262 @@ def parse_lists(lines):
         list2.append(int(item2))
     return list1, list2
 
-def solve2(lines: Lines) -> int:
-    """Solve the problem."""
-    left_list, right_list = parse_lists(lines)
-    
-    num_occurs = defaultdict(int)
-    for item in right_list:
-        num_occurs[item] += 1
+INT64 = np.iinfo(np.int64)
+
+def parse_columns(text: str):
+    """Parse the whole two-column text in one go into two int64 arrays.
+    np.fromstring clamps values that don't fit in an int64, so if any value
+    sits at either end of the range the text is parsed again into arrays of
+    Python ints, which keep every value exact."""
+    values = np.fromstring(text, dtype=np.int64, sep=' ')
+    if values.size and (values.max() == INT64.max or values.min() == INT64.min):
+        left, right = parse_lists(text.splitlines())
+        return np.array(left, dtype=object), np.array(right, dtype=object)
+    pairs = values.reshape(-1, 2)
+    return pairs[:, 0].copy(), pairs[:, 1].copy()
+
+def input_columns(data: Union[Lines, str]):
+    """parse_columns for either the raw input text or its lines. Passing
+    the text skips splitting it into lines only to join them back."""
+    return parse_columns(data if isinstance(data, str) else "\n".join(data))
+
+def total_distance(left, right) -> int:
+    """Sorts both lists in place. The differences are summed in int64 when
+    no difference or partial sum can overflow, and in Python ints otherwise."""
+    left.sort()
+    right.sort()
+    if not len(left):
+        return 0
+    if isinstance(left, np.ndarray) and isinstance(right, np.ndarray) \
+            and left.dtype.kind in "iu" and right.dtype.kind in "iu":
+        bound = max(-int(min(left[0], right[0])), int(max(left[-1], right[-1])))
+        if 2 * bound * len(left) < 1 << 63:
+            return int(np.abs(left.astype(np.int64) - right.astype(np.int64)).sum())
+        left, right = left.tolist(), right.tolist()
+    return sum(abs(item1 - item2) for item1, item2 in zip(left, right))
+
+EXTERNAL_CHUNK_ROWS = 1_000_000
+
+def write_runs(fp, chunk_rows, tmpdir):
+    """Split the input into sorted runs of at most chunk_rows values per
+    column, written as raw int64 files. Returns the left and right run paths."""
+    left_runs, right_runs = [], []
+    while True:
+        chunk = "".join(islice(fp, chunk_rows))
+        if not chunk.strip():
+            break
+        left, right = parse_columns(chunk)
+        if left.dtype != np.int64:
+            raise ValueError("external mode needs values that fit in an int64")
+        for name, column, runs in (("left", left, left_runs), ("right", right, right_runs)):
+            column.sort()
+            path = Path(tmpdir) / f"{name}{len(runs)}.bin"
+            column.tofile(path)
+            runs.append(path)
+    return left_runs, right_runs
+
+def read_run(path, block):
+    """Stream the values of a run file, block values at a time."""
+    with open(path, "rb") as fp:
+        while True:
+            values = np.fromfile(fp, dtype=np.int64, count=block)
+            if not values.size:
+                break
+            yield from values.tolist()
+
+def total_distance_external(infile: str, chunk_rows: int = EXTERNAL_CHUNK_ROWS) -> int:
+    """Same answer as total_distance, for inputs that don't fit in memory.
+    Each column is sorted in chunks of chunk_rows into temporary run files,
+    then the runs of both columns are k-way merged and the two sorted
+    streams are compared pair by pair. At most about chunk_rows values per
+    column are held in memory at any time."""
+    with tempfile.TemporaryDirectory() as tmpdir, open(infile) as fp:
+        left_runs, right_runs = write_runs(fp, chunk_rows, tmpdir)
+        block = max(1, chunk_rows // max(1, len(left_runs)))
+        left = heapq.merge(*(read_run(path, block) for path in left_runs))
+        right = heapq.merge(*(read_run(path, block) for path in right_runs))
+        return sum(abs(item1 - item2) for item1, item2 in zip(left, right))
+
+BINCOUNT_LIMIT = 1 << 24
+
+def similarity(left, right) -> int:
+    """Sum of each left item times the number of times it appears in right.
+    Integer arrays are counted with bincount when the values are small
+    enough for a dense table (below BINCOUNT_LIMIT and within a few times
+    the length of right), and with unique + searchsorted otherwise; the
+    products are summed in Python ints when they could overflow int64.
+    Anything else falls back to a Counter."""
+    if not (isinstance(left, np.ndarray) and isinstance(right, np.ndarray)
+            and left.dtype.kind in "iu" and right.dtype.kind in "iu"):
+        num_occurs = Counter(right)
+        return sum(item * num_occurs[item] for item in left)
+    if not len(left) or not len(right):
+        return 0
+
+    low = int(min(left.min(), right.min()))
+    high = int(max(left.max(), right.max()))
+    # a dense table only pays off if it isn't much bigger than the lists
+    if low >= 0 and high < BINCOUNT_LIMIT and high <= 4 * len(right):
+        num_occurs = np.bincount(right.astype(np.intp), minlength=high + 1)[left.astype(np.intp)]
+    else:
+        values, counts = np.unique(right, return_counts=True)
+        idx = np.searchsorted(values, left).clip(max=len(values) - 1)
+        num_occurs = np.where(values[idx] == left, counts[idx], 0)
+
+    # the int64 sum is only exact if no product or partial sum can overflow
+    if max(-low, high) * int(num_occurs.max()) * len(left) < 1 << 63:
+        return int((left.astype(np.int64) * num_occurs).sum())
+    found = num_occurs > 0
+    return sum(item * count for item, count in zip(left[found].tolist(), num_occurs[found].tolist()))
+
+VALUE_LIMIT = 100_000
+
+class OnlineLists:
+    """The total distance and the similarity score of two lists of integers
+    in [0, limit), updated as pairs are added and removed instead of
+    recomputed.
+
+    With F_L(t) and F_R(t) the number of left and right items <= t, the
+    sorted pairing gives distance = sum over t of |D(t)|, D = F_L - F_R.
+    A pair (x, y) adds 1 to D on [x, y) if x < y, or subtracts 1 on [y, x)
+    if y < x, so an update is a +-1 range update of D. D is kept in blocks
+    of about sqrt(limit) values: a block covered by the whole range only
+    moves its lazy offset, using a count of its values per base value and
+    of its values >= 0 to update the sum of |D|, and only the two end
+    blocks are updated value by value. That is O(sqrt(limit)) per update,
+    whatever the length of the lists, so it beats recomputing with
+    total_distance and similarity from about ten thousand pairs up (see
+    benchmark). The similarity score only needs the counts of x and y."""
 
-    ans = 0
-    for item in left_list:
-        ans += item * num_occurs[item]
+    def __init__(self, limit: int = VALUE_LIMIT):
+        self.limit = limit
+        self.block_size = max(1, math.isqrt(limit))
+        num_blocks = -(-limit // self.block_size)
+        sizes = [min(self.block_size, limit - b * self.block_size) for b in range(num_blocks)]
+        self.base = [0] * limit
+        self.lazy = [0] * num_blocks
+        self.hist = [Counter({0: size}) for size in sizes]
+        self.sizes = sizes
+        # values >= 0 in each block; everything starts at 0
+        self.nonneg = list(sizes)
+        self.left_count = Counter()
+        self.right_count = Counter()
+        self.distance = 0
+        self.similarity = 0
 
-    return ans
+    @classmethod
+    def from_columns(cls, left, right, limit: int = VALUE_LIMIT) -> "OnlineLists":
+        """Start from two whole lists in O(n + limit), without adding the
+        pairs one at a time."""
+        left = np.asarray(left, dtype=np.int64)
+        right = np.asarray(right, dtype=np.int64)
+        if len(left) != len(right):
+            raise ValueError("the lists must have the same length")
+        if len(left) and (min(left.min(), right.min()) < 0 or max(left.max(), right.max()) >= limit):
+            raise ValueError(f"items must be in [0, {limit})")
+        online = cls(limit)
+        diff = np.cumsum(np.bincount(left, minlength=limit) - np.bincount(right, minlength=limit))
+        online.base = diff.tolist()
+        for b in range(len(online.sizes)):
+            block = diff[b * online.block_size:(b + 1) * online.block_size]
+            values, counts = np.unique(block, return_counts=True)
+            online.hist[b] = Counter(dict(zip(values.tolist(), counts.tolist())))
+            online.nonneg[b] = int((block >= 0).sum())
+        online.distance = int(np.abs(diff).sum())
+        online.left_count = Counter(left.tolist())
+        online.right_count = Counter(right.tolist())
+        online.similarity = similarity(left, right)
+        return online
 
-def solve(lines: Lines) -> int:
+    @classmethod
+    def from_lines(cls, lines: Lines, limit: int = VALUE_LIMIT) -> "OnlineLists":
+        return cls.from_columns(*input_columns(lines), limit)
+
+    def shift_values(self, lo, hi, step):
+        """Add step to D(t) for lo <= t < hi, all within one block."""
+        if lo >= hi:
+            return
+        b = lo // self.block_size
+        base, hist, lazy = self.base, self.hist[b], self.lazy[b]
+        # the values that cross between -1 and 0
+        crossing = -1 - lazy if step > 0 else -lazy
+        grow = crossed = 0
+        for t in range(lo, hi):
+            old = base[t]
+            if old == crossing:
+                crossed += 1
+            # |D| grows if D moves away from zero, i.e. D >= 0 going up or
+            # D <= 0 going down
+            grow += (old + lazy >= 0) if step > 0 else (old + lazy <= 0)
+            hist[old] -= 1
+            hist[old + step] += 1
+            base[t] = old + step
+        self.distance += 2 * grow - (hi - lo)
+        self.nonneg[b] += crossed if step > 0 else -crossed
+
+    def shift_block(self, b, step):
+        """Add step to D(t) for every t in block b."""
+        size, nonneg, lazy = self.sizes[b], self.nonneg[b], self.lazy[b]
+        if step > 0:
+            # values >= 0 grow, the others shrink; -1 becomes 0
+            self.distance += 2 * nonneg - size
+            self.nonneg[b] = nonneg + self.hist[b][-1 - lazy]
+        else:
+            # values > 0 shrink, the others grow; 0 becomes -1
+            zeros = self.hist[b][-lazy]
+            self.distance += size - 2 * (nonneg - zeros)
+            self.nonneg[b] = nonneg - zeros
+        self.lazy[b] = lazy + step
+
+    def shift_range(self, lo, hi, step):
+        """Add step (+1 or -1) to D(t) for lo <= t < hi."""
+        first, last = -(-lo // self.block_size), hi // self.block_size
+        if first >= last:
+            # no whole block, but lo and hi may still be in two blocks
+            split = min(hi, first * self.block_size)
+            self.shift_values(lo, split, step)
+            self.shift_values(split, hi, step)
+            return
+        self.shift_values(lo, first * self.block_size, step)
+        for b in range(first, last):
+            self.shift_block(b, step)
+        self.shift_values(last * self.block_size, hi, step)
+
+    def shift_pair(self, item1, item2, sign):
+        if item1 < item2:
+            self.shift_range(item1, item2, sign)
+        else:
+            self.shift_range(item2, item1, -sign)
+
+    def add_pair(self, item1, item2) -> None:
+        if not (0 <= item1 < self.limit and 0 <= item2 < self.limit):
+            raise ValueError(f"({item1}, {item2}) is outside [0, {self.limit})")
+        self.shift_pair(item1, item2, 1)
+
+        self.left_count[item1] += 1
+        self.similarity += item1 * self.right_count[item1]
+        self.right_count[item2] += 1
+        self.similarity += item2 * self.left_count[item2]
+
+    def remove_pair(self, item1, item2) -> None:
+        if not (self.left_count[item1] > 0 and self.right_count[item2] > 0):
+            raise ValueError(f"({item1}, {item2}) is not in the lists")
+        self.shift_pair(item1, item2, -1)
+
+        self.right_count[item2] -= 1
+        self.similarity -= item2 * self.left_count[item2]
+        self.left_count[item1] -= 1
+        self.similarity -= item1 * self.right_count[item1]
+
+def solve2(lines: Union[Lines, str]) -> int:
     """Solve the problem."""
-    left_list, right_list = parse_lists(lines)
+    left, right = input_columns(lines)
+    return similarity(left, right)
 
-    ans = 0
-    for item1, item2 in zip(sorted(left_list), sorted(right_list)):
-        ans += abs(item1 - item2)
-    return ans
+def solve(lines: Union[Lines, str]) -> int:
+    """Solve the problem."""
+    left, right = input_columns(lines)
+    return total_distance(left, right)
 
 
 # PART 1
@@ -119,9 +360,14 @@ def example1() -> None:
         result = solve(lines)
         print(f"'{text}' -> {result} (expected {expected})")
         assert result == expected
+        # external mode, with runs of 2 rows so several runs get merged
+        with tempfile.TemporaryDirectory() as tmpdir:
+            infile = Path(tmpdir) / "input.txt"
+            infile.write_text("\n".join(lines) + "\n")
+            assert total_distance_external(str(infile), chunk_rows=2) == result
     print("= " * 32)
 
-def part1(lines: Lines) -> None:
+def part1(lines: Union[Lines, str]) -> None:
     print("PART 1:")
     result = solve(lines)
     print(f"result is {result}")
@@ -141,7 +387,7 @@ def example2() -> None:
         assert result == expected
     print("= " * 32)
 
-def part2(lines: Lines) -> None:
+def part2(lines: Union[Lines, str]) -> None:
     print("PART 2:")
     result = solve2(lines)
     print(f"result is {result}")
@@ -149,9 +395,40 @@ def part2(lines: Lines) -> None:
     print("= " * 32)
 
 
+# BENCHMARK
+
+def benchmark() -> None:
+    print("BENCHMARK:")
+    rng = np.random.default_rng(0)
+    for n in [1000, 100_000, 1_000_000]:
+        left = rng.integers(0, VALUE_LIMIT, n)
+        right = rng.integers(0, VALUE_LIMIT, n)
+        online = OnlineLists.from_columns(left, right)
+        pairs = rng.integers(0, VALUE_LIMIT, (200, 2)).tolist()
+
+        t0 = time.perf_counter()
+        for item1, item2 in pairs:
+            online.add_pair(item1, item2)
+        for item1, item2 in pairs:
+            online.remove_pair(item1, item2)
+        t1 = time.perf_counter()
+        rounds = 10
+        for _ in range(rounds):
+            distance = total_distance(left.copy(), right.copy())
+            score = similarity(left, right)
+        t2 = time.perf_counter()
+        assert (online.distance, online.similarity) == (distance, score)
+        print(f"{n} pairs: online update {(t1 - t0) / (2 * len(pairs)) * 1e6:.0f}us, "
+              f"numpy recompute {(t2 - t1) / rounds * 1e6:.0f}us")
+    print("= " * 32)
+
+
 if __name__ == "__main__":
+    if "--bench" in sys.argv:
+        benchmark()
+        sys.exit(0)
     example1()
-    input_lines = load_input(INPUTFILE)
-    part1(input_lines)
+    input_text = Path(INPUTFILE).read_text()
+    part1(input_text)
     example2()
-    part2(input_lines)
+    part2(input_text)
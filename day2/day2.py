@@ -125,15 +125,62 @@ def get_deltas_list(line):
         deltas.append(line[i+1] - line[i])
     return deltas
 
+def is_steady(line, sign):
+    """Does the report step by 1-3 in the direction of sign (1 for
+    increasing, -1 for decreasing) all the way through?"""
+    levels = iter(line)
+    prev = next(levels, None)
+    for level in levels:
+        if not 1 <= sign * (level - prev) <= 3:
+            return False
+        prev = level
+    return True
+
+def is_safe_in_direction(line, sign):
+    """is_steady, but one level may be dropped. One pass, tracking the last
+    level kept with nothing skipped (None once that's impossible) and the
+    possible last levels kept after one skip: kept_level if the level just
+    read was kept, kept_last if it was the one skipped. first_skipped covers
+    the case where the skipped level was the first, so nothing is kept yet."""
+    levels = iter(line)
+    last = next(levels, None)
+    first_skipped = True
+    kept_level = kept_last = None
+    for level in levels:
+        if (first_skipped
+                or (kept_level is not None and 1 <= sign * (level - kept_level) <= 3)
+                or (kept_last is not None and 1 <= sign * (level - kept_last) <= 3)):
+            kept_level = level
+        else:
+            kept_level = None
+        # skipping this level leaves the last level kept without a skip
+        kept_last = last
+        first_skipped = False
+        if last is not None:
+            last = level if 1 <= sign * (level - last) <= 3 else None
+        if last is None and kept_level is None and kept_last is None:
+            return False
+    return True
+
+def is_safe_fast(line, can_skip=False):
+    """Same verdict as is_safe (can_skip=False) or is_safe_new (can_skip=True),
+    without building deltas or sliced copies of the report."""
+    if not can_skip:
+        # the first step decides the only direction that can work
+        if len(line) < 2:
+            return True
+        return is_steady(line, 1 if line[1] > line[0] else -1)
+    return is_safe_in_direction(line, 1) or is_safe_in_direction(line, -1)
+
 def solve2(lines: Lines) -> int:
     """Solve the problem."""
     lines = parse_lines(lines)
-    return sum([1 for line in lines if is_safe_new(line)])
+    return sum([1 for line in lines if is_safe_fast(line, can_skip=True)])
 
 def solve(lines: Lines) -> int:
     """Solve the problem."""
     lines = parse_lines(lines)
-    return sum([1 for line in lines if is_safe(line)])
+    return sum([1 for line in lines if is_safe_fast(line)])
 
 
 # PART 1
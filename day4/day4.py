@@ -4,11 +4,15 @@
 #
 from typing import Sequence, Union, Optional, Any, Dict, List, Tuple
 from pathlib import Path
-from collections import defaultdict
+from collections import defaultdict, deque
 from dataclasses import dataclass
 from pprint import pprint
 import math
 import re
+import sys
+import time
+
+import numpy as np
 
 INPUTFILE = "input.txt"
 
@@ -107,39 +111,241 @@ BLOCKS = [
 X_BLOCKS = [
     [(-1,-1), (-1,1), (0,0), (1,-1), (1,1)]
 ]
-def get_valid_words(x, y, grid, target_words, pattern):
-    valid_words = 0
-    for block in pattern:
-        word = ''
-        for deltaX, deltaY in block:
-            new_x = deltaX + x
-            new_y = deltaY + y
-            if 0 <= new_x < len(grid) and 0 <= new_y < len(grid[0]):
-                word += grid[new_x][new_y]
-        if word in target_words:
-            valid_words += 1
-    return valid_words
+@dataclass(frozen=True)
+class Stencil:
+    """A pattern of (dx, dy, char) cells, anchored at (0, 0)."""
+    cells: Tuple[Tuple[int, int, str], ...]
 
+    @classmethod
+    def from_block(cls, block, word):
+        """The stencil that reads word along one of the BLOCKS offset lists."""
+        return cls(tuple((dx, dy, c) for (dx, dy), c in zip(block, word)))
 
-def solve2(lines: Lines) -> int:
-    """Solve the problem."""
-    grid = [list(line) for line in lines]
+    def compile(self, rows, cols) -> "CompiledStencil":
+        """Turn the offsets into flat row-major offsets for a rows x cols grid,
+        and work out the anchors for which every cell lands on the grid."""
+        dxs = [dx for dx, _, _ in self.cells]
+        dys = [dy for _, dy, _ in self.cells]
+        return CompiledStencil(
+            offsets=[dx * cols + dy for dx, dy, _ in self.cells],
+            chars=[ord(c) for _, _, c in self.cells],
+            cols=cols,
+            x_range=(max(0, -min(dxs)), rows - max(0, max(dxs))),
+            y_range=(max(0, -min(dys)), cols - max(0, max(dys))),
+        )
+
+@dataclass
+class CompiledStencil:
+    offsets: List[int]
+    chars: List[int]
+    cols: int
+    x_range: Tuple[int, int]
+    y_range: Tuple[int, int]
+
+    def mask(self, flat, pad):
+        """Mask over the interior anchors (x_range by y_range) of where the
+        stencil matches. flat is the grid from padded_flat_grid, so every
+        offset is just a shifted slice and no bounds are checked per cell.
+        An anchor nearer the border would put part of the stencil off the
+        grid, and a stencil only matches if every cell does, so there is
+        nothing to find there."""
+        (x0, x1), (y0, y1) = self.x_range, self.y_range
+        if x0 >= x1 or y0 >= y1:
+            return np.zeros((0, 0), dtype=bool)
+        start = pad + x0 * self.cols
+        size = (x1 - x0) * self.cols
+        result = None
+        for offset, char in zip(self.offsets, self.chars):
+            view = flat[start + offset:start + offset + size].reshape(x1 - x0, self.cols)
+            matched = view[:, y0:y1] == char
+            result = matched if result is None else result & matched
+        return result
+
+    def count(self, flat, pad):
+        return int(self.mask(flat, pad).sum())
+
+    def matches(self, flat, pad):
+        """(x, y) anchor of every match."""
+        xs, ys = np.nonzero(self.mask(flat, pad))
+        return list(zip((xs + self.x_range[0]).tolist(), (ys + self.y_range[0]).tolist()))
+
+def make_stencils(pattern, target_words):
+    return [Stencil.from_block(block, word) for block in pattern for word in target_words]
+
+def padded_flat_grid(lines):
+    """The grid as one flat array of character codes, with a row of zeros
+    on either side so that shifted slices never run off the ends."""
+    pad = len(lines[0])
+    return np.pad(grid_array(lines).ravel(), pad), pad
+
+def count_stencils(lines, stencils):
+    flat, pad = padded_flat_grid(lines)
+    rows, cols = len(lines), len(lines[0])
+    return sum(stencil.compile(rows, cols).count(flat, pad) for stencil in stencils)
+
+
+# (dx, dy) of one step along each flat_grid stride
+DIRECTION_STEPS = [(0, 1), (1, 0), (1, 1), (1, -1)]
+
+def flat_grid(lines):
+    """Join the grid into one string, with a newline closing every row so
+    that no word can run off one row and into the next. Moving one step
+    right, down, down-right or down-left is then a fixed stride."""
+    width = len(lines[0]) + 1
+    return "\n".join(lines) + "\n", [1, width, width + 1, width - 1]
+
+def find_all(seq, word):
+    """Start of every (possibly overlapping) occurrence of word in seq."""
+    pos = seq.find(word)
+    while pos >= 0:
+        yield pos
+        pos = seq.find(word, pos + 1)
+
+def count_words(lines, word):
+    """Count word, forwards and backwards, in every direction. Overlapping
+    occurrences all count, so 'AA' is found 3 times in 'AAAA'."""
+    buf, strides = flat_grid(lines)
+    targets = {word, word[::-1]}
     ans = 0
-    target_words = {'MMASS', 'SSAMM', 'MSAMS', 'SMASM'}
-    for i in range(len(grid)):
-        for j in range(len(grid[0])):
-            ans += get_valid_words(i, j, grid, target_words, X_BLOCKS)
+    for stride in strides:
+        # buf[start::stride] runs through every line in that direction,
+        # with the newlines keeping them apart
+        for start in range(stride):
+            seq = buf[start::stride]
+            ans += sum(sum(1 for _ in find_all(seq, target)) for target in targets)
     return ans
 
+def word_centers(buf, stride, word):
+    """Flat index of the middle letter of every 3-letter word running
+    along stride, forwards or backwards."""
+    centers = set()
+    for start in range(stride):
+        seq = buf[start::stride]
+        for target in {word, word[::-1]}:
+            for pos in find_all(seq, target):
+                centers.add(start + (pos + 1) * stride)
+    return centers
+
+class AhoCorasick:
+    """Automaton that finds every occurrence of any of a set of patterns in
+    a single pass over a string."""
+
+    def __init__(self, patterns: Sequence[str]):
+        self.patterns = list(patterns)
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for idx, pattern in enumerate(self.patterns):
+            node = 0
+            for c in pattern:
+                if c not in self.goto[node]:
+                    self.goto[node][c] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = self.goto[node][c]
+            self.out[node].append(idx)
+
+        # breadth-first, so every node's fail link is set before its children's
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for c, child in self.goto[node].items():
+                queue.append(child)
+                fail = self.fail[node]
+                while fail and c not in self.goto[fail]:
+                    fail = self.fail[fail]
+                if node:
+                    self.fail[child] = self.goto[fail].get(c, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def search(self, seq: str):
+        """Yield (end index, pattern index) for every match in seq."""
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for i, c in enumerate(seq):
+            while node and c not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(c, 0)
+            for idx in out[node]:
+                yield i, idx
+
+def search_grid(lines, words, positions=False):
+    """Count every word in the grid, in all eight directions, with one
+    automaton and one pass per line of the grid. A word and its reverse
+    share the pass, so each line is only read forwards. With positions=True
+    also returns, per word, the ((x, y), (dx, dy)) of its first letter and
+    direction for every match."""
+    buf, strides = flat_grid(lines)
+    width = strides[1]
+    # pattern -> every (word, read backwards?) it stands for, since a word
+    # can be another's reverse; a palindrome is only read forwards
+    words = list(dict.fromkeys(words))
+    patterns = defaultdict(list)
+    for word in words:
+        patterns[word].append((word, False))
+        if word[::-1] != word:
+            patterns[word[::-1]].append((word, True))
+    automaton = AhoCorasick(list(patterns))
+    owners = [patterns[pattern] for pattern in automaton.patterns]
+
+    counts = {word: 0 for word in words}
+    found = {word: [] for word in words}
+    for stride, (dx, dy) in zip(strides, DIRECTION_STEPS):
+        for start in range(stride):
+            for end, idx in automaton.search(buf[start::stride]):
+                for word, backwards in owners[idx]:
+                    counts[word] += 1
+                    if positions:
+                        first = end if backwards else end - len(word) + 1
+                        x, y = divmod(start + first * stride, width)
+                        found[word].append(((x, y), (-dx, -dy) if backwards else (dx, dy)))
+    if positions:
+        return counts, found
+    return counts
+
+def grid_array(lines):
+    """The grid as a (rows, cols) array of character codes."""
+    return np.frombuffer("".join(lines).encode(), dtype=np.uint8).reshape(len(lines), len(lines[0]))
+
+def window(g, dx, dy, k, n):
+    """g shifted k steps along (dx, dy), cropped to the cells where a word
+    of n letters going in that direction stays on the grid."""
+    rows, cols = g.shape
+    span_x, span_y = (n - 1) * dx, (n - 1) * dy
+    x0, x1 = max(0, -span_x) + k * dx, rows - max(0, span_x) + k * dx
+    y0, y1 = max(0, -span_y) + k * dy, cols - max(0, span_y) + k * dy
+    return g[x0:x1, y0:y1]
+
+def match_word(g, word, dx, dy):
+    """Mask of the cells where word starts, going in direction (dx, dy)."""
+    n = len(word)
+    return np.logical_and.reduce([window(g, dx, dy, k, n) == ord(c) for k, c in enumerate(word)])
+
+def count_word_matches(g, word):
+    ans = 0
+    for target in {word, word[::-1]}:
+        for dx, dy in DIRECTION_STEPS:
+            ans += int(match_word(g, target, dx, dy).sum())
+    return ans
+
+def x_mas_mask(g):
+    """Mask of the interior cells at the centre of an X-MAS."""
+    M, A, S = ord('M'), ord('A'), ord('S')
+    up_left, down_right = g[:-2, :-2], g[2:, 2:]
+    up_right, down_left = g[:-2, 2:], g[2:, :-2]
+    diagonal = ((up_left == M) & (down_right == S)) | ((up_left == S) & (down_right == M))
+    anti_diagonal = ((up_right == M) & (down_left == S)) | ((up_right == S) & (down_left == M))
+    return (g[1:-1, 1:-1] == A) & diagonal & anti_diagonal
+
+def solve2(lines: Lines) -> int:
+    """Solve the problem."""
+    return int(x_mas_mask(grid_array(lines)).sum())
+
 def solve(lines: Lines) -> int:
     """Solve the problem."""
-    grid = [list(line) for line in lines]
-    ans = 0
     target_words = {'XMAS', 'SAMX'}
-    for i in range(len(grid)):
-        for j in range(len(grid[0])):
-            ans += get_valid_words(i, j, grid, target_words, BLOCKS)
-    return ans
+    return count_stencils(lines, make_stencils(BLOCKS, target_words))
 
 
 # PART 1
@@ -152,6 +358,10 @@ def example1() -> None:
         result = solve(lines)
         print(f"'{text}' -> {result} (expected {expected})")
         assert result == expected
+        # a word and its reverse are each found the same number of times
+        assert search_grid(lines, ['XMAS', 'SAMX']) == {'XMAS': expected, 'SAMX': expected}
+        assert count_words(lines, 'XMAS') == expected
+        assert count_word_matches(grid_array(lines), 'XMAS') == expected
     print("= " * 32)
 
 def part1(lines: Lines) -> None:
@@ -182,7 +392,49 @@ def part2(lines: Lines) -> None:
     print("= " * 32)
 
 
+# BENCHMARK
+
+def random_grid(size: int, seed: int = 0) -> Lines:
+    rng = np.random.default_rng(seed)
+    letters = np.frombuffer(b"XMAS", dtype=np.uint8)
+    cells = letters[rng.integers(0, 4, (size, size))]
+    return [row.tobytes().decode() for row in cells]
+
+def benchmark() -> None:
+    print("BENCHMARK:")
+    for name, lines in [("input", load_input(INPUTFILE)), ("random 10000", random_grid(10000))]:
+        t0 = time.perf_counter()
+        stencils = solve(lines)
+        t1 = time.perf_counter()
+        strided = count_words(lines, 'XMAS')
+        t2 = time.perf_counter()
+        masked = count_word_matches(grid_array(lines), 'XMAS')
+        t3 = time.perf_counter()
+        print(f"{name} part 1: stencils {t1 - t0:.3f}s ({stencils}), "
+              f"strided scan {t2 - t1:.3f}s ({strided}), shifted arrays {t3 - t2:.3f}s ({masked})")
+        if len(lines) <= 1000:
+            # pure Python per character, far too slow for the big grid
+            t0 = time.perf_counter()
+            found = search_grid(lines, ['XMAS', 'SAMX'])
+            t1 = time.perf_counter()
+            print(f"{name} part 1: automaton {t1 - t0:.3f}s ({found})")
+
+        t0 = time.perf_counter()
+        stencils = count_stencils(lines, make_stencils(X_BLOCKS, {'MMASS', 'SSAMM', 'MSAMS', 'SMASM'}))
+        t1 = time.perf_counter()
+        masked = solve2(lines)
+        t2 = time.perf_counter()
+        buf, strides = flat_grid(lines)
+        strided = len(word_centers(buf, strides[2], 'MAS') & word_centers(buf, strides[3], 'MAS'))
+        t3 = time.perf_counter()
+        print(f"{name} part 2: stencils {t1 - t0:.3f}s ({stencils}), "
+              f"shifted arrays {t2 - t1:.3f}s ({masked}), strided scan {t3 - t2:.3f}s ({strided})")
+    print("= " * 32)
+
 if __name__ == "__main__":
+    if "--bench" in sys.argv:
+        benchmark()
+        sys.exit(0)
     example1()
     input_lines = load_input(INPUTFILE)
     part1(input_lines)
@@ -7,9 +7,13 @@ from pathlib import Path
 from collections import defaultdict
 from dataclasses import dataclass
 from pprint import pprint
+import heapq
+import io
 import math
 import re
 
+import numpy as np
+
 INPUTFILE = "input.txt"
 
 SAMPLE_CASES = [
@@ -135,29 +139,197 @@ def parse_input(lines):
 
 # Solution
 def is_update_valid(rules, update):
-    seen_objs = []
-    for item in update:
-        for seen_obj in seen_objs:
-            if rules.get(item) and seen_obj in rules.get(item):
+    position = {page: i for i, page in enumerate(update)}
+    for i, page in enumerate(update):
+        for after in rules.get(page, ()):
+            # any page that has to come after this one must not be earlier
+            if position.get(after, i) < i:
                 return False
-        seen_objs.append(item)
     return True
 
+def compile_rules(rules):
+    """Dense version of the rules: matrix[a, b] is True if page a has to come
+    before page b. The last row/column is an unused page for padding."""
+    pages = set(rules).union(*rules.values())
+    size = max(pages, default=-1) + 2
+    matrix = np.zeros((size, size), dtype=bool)
+    for page, after in rules.items():
+        matrix[page, list(after)] = True
+    return matrix
+
+def valid_updates(matrix, updates):
+    """Check a whole batch of updates against the compiled rules at once.
+    Returns a boolean array with one entry per update."""
+    if not updates:
+        return np.zeros(0, dtype=bool)
+    pad = len(matrix) - 1
+    length = max(len(update) for update in updates)
+    pages = np.full((len(updates), length), pad)
+    for k, update in enumerate(updates):
+        pages[k, :len(update)] = update
+    # pages the rules don't mention can go anywhere, same as the padding
+    pages[pages >= pad] = pad
+
+    # broken[k, i, j]: in update k, page j has to come before page i
+    broken = matrix[pages[:, None, :], pages[:, :, None]]
+    later = np.triu(np.ones((length, length), dtype=bool), k=1)
+    return ~(broken & later).any(axis=(1, 2))
+
+STREAM_BATCH_SIZE = 10000
+
+def checked_updates(matrix, updates, batch_size: int = STREAM_BATCH_SIZE):
+    """Yield (update, is_valid) for every update, checking batch_size updates
+    at a time so the (batch, length, length) array valid_updates builds
+    stays bounded."""
+    for start in range(0, len(updates), batch_size):
+        batch = updates[start:start + batch_size]
+        yield from zip(batch, valid_updates(matrix, batch))
+
 def sort_update(rules, update):
-    while not is_update_valid(rules, update):
-        for i in range(len(update)):
-            for j in range(i+1, len(update)):
-                # swap if they are out of order
-                if rules.get(update[j]) and update[i] in rules.get(update[j]):
-                    update[i], update[j] = update[j], update[i]
-    return update
+    """Order the update with Kahn's algorithm on the rules between its pages.
+    When the rules leave a choice, pages keep their original relative order,
+    so the result doesn't depend on how the rule sets happen to iterate.
+    Raises ValueError if the rules between its pages form a cycle."""
+    position = {page: i for i, page in enumerate(update)}
+    num_before = {page: 0 for page in update}
+    for page in update:
+        for after in rules.get(page, ()):
+            if after in position:
+                num_before[after] += 1
+
+    ready = [(i, page) for i, page in enumerate(update) if num_before[page] == 0]
+    sorted_update = []
+    while ready:
+        _, page = heapq.heappop(ready)
+        sorted_update.append(page)
+        for after in rules.get(page, ()):
+            if after in position:
+                num_before[after] -= 1
+                if num_before[after] == 0:
+                    heapq.heappush(ready, (position[after], after))
+    if len(sorted_update) != len(update):
+        stuck = [page for page in update if num_before[page] > 0]
+        raise ValueError(f"rules form a cycle between pages {stuck}")
+    return sorted_update
+
+def read_rules(fp):
+    """Read the rules section from an open file, stopping at the blank line."""
+    rules = {}
+    for line in fp:
+        line = line.strip()
+        if not line:
+            if rules:
+                break
+            continue
+        entry, update_before = line.split('|')
+        entry = int(entry)
+        update_before = int(update_before)
+        if rules.get(entry):
+            rules[entry].add(update_before)
+        else:
+            rules[entry] = {update_before}
+    return rules
+
+def sum_batch(rules, matrix, updates):
+    """Middle-page sums of the valid updates, and of the fixed invalid ones."""
+    ans = ans2 = 0
+    for update, is_valid in checked_updates(matrix, updates):
+        if is_valid:
+            ans += update[len(update) // 2]
+        else:
+            ans2 += sort_update(rules, update)[len(update) // 2]
+    return ans, ans2
+
+class RuleBook:
+    """Keeps the part 1 and part 2 totals for a fixed list of updates up to
+    date while rules are added and removed. Every update is indexed by the
+    page pairs it contains, so a rule change only re-checks the updates that
+    contain both of its pages."""
+
+    def __init__(self, rules, updates):
+        self.rules = {page: set(after) for page, after in rules.items()}
+        self.updates = updates
+        self.pairs = defaultdict(list)
+        for k, update in enumerate(updates):
+            for i in range(len(update)):
+                for j in range(i + 1, len(update)):
+                    self.pairs[frozenset((update[i], update[j]))].append(k)
+
+        self.part1 = [0] * len(updates)
+        self.part2 = [0] * len(updates)
+        self.total = self.total2 = 0
+        for k in range(len(updates)):
+            self.update_totals(k, *self.contribution(k))
+
+    def contribution(self, k) -> Tuple[int, int]:
+        """Update k's (part 1, part 2) contribution under the current rules."""
+        update = self.updates[k]
+        if is_update_valid(self.rules, update):
+            return update[len(update) // 2], 0
+        return 0, sort_update(self.rules, update)[len(update) // 2]
+
+    def update_totals(self, k, part1, part2):
+        """Replace update k's contribution to the totals."""
+        self.total += part1 - self.part1[k]
+        self.total2 += part2 - self.part2[k]
+        self.part1[k], self.part2[k] = part1, part2
+
+    def recheck(self, affected):
+        """Recompute the contributions of the affected updates. Nothing is
+        changed if one of them can't be sorted (sort_update raises)."""
+        changes = [(k, self.contribution(k)) for k in affected]
+        for k, (part1, part2) in changes:
+            self.update_totals(k, part1, part2)
+
+    def add_rule(self, before, after) -> Tuple[int, int]:
+        """Add the rule before|after and return the new (part 1, part 2) totals.
+        Raises ValueError, leaving the book as it was, if the rule closes a
+        cycle within one of the updates."""
+        old_after = self.rules.get(before)
+        self.rules[before] = (old_after or set()) | {after}
+        try:
+            self.recheck(self.pairs.get(frozenset((before, after)), ()))
+        except ValueError:
+            if old_after is None:
+                del self.rules[before]
+            else:
+                self.rules[before] = old_after
+            raise
+        return self.total, self.total2
+
+    def remove_rule(self, before, after) -> Tuple[int, int]:
+        """Remove the rule before|after and return the new (part 1, part 2) totals."""
+        self.rules.get(before, set()).discard(after)
+        self.recheck(self.pairs.get(frozenset((before, after)), ()))
+        return self.total, self.total2
+
+def solve_stream(fp, batch_size: int = STREAM_BATCH_SIZE) -> Tuple[int, int]:
+    """Solve both parts reading from an open file. The rules are compiled
+    first, then the updates are read and checked batch_size lines at a time,
+    so memory doesn't grow with the number of updates."""
+    rules = read_rules(fp)
+    matrix = compile_rules(rules)
+    ans = ans2 = 0
+    batch = []
+    for line in fp:
+        line = line.strip()
+        if not line:
+            continue
+        batch.append([int(entry) for entry in line.split(',')])
+        if len(batch) == batch_size:
+            part1, part2 = sum_batch(rules, matrix, batch)
+            ans += part1
+            ans2 += part2
+            batch = []
+    part1, part2 = sum_batch(rules, matrix, batch)
+    return ans + part1, ans2 + part2
 
 def solve2(lines: Lines) -> int:
     """Solve the problem."""
     rules, updates = parse_input(lines)
     ans = 0
-    for update in updates:
-        if not is_update_valid(rules, update):
+    for update, is_valid in checked_updates(compile_rules(rules), updates):
+        if not is_valid:
             sorted_update = sort_update(rules, update)
             ans += sorted_update[len(update) // 2]
     return ans
@@ -166,8 +338,8 @@ def solve(lines: Lines) -> int:
     """Solve the problem."""
     rules, updates = parse_input(lines)
     ans = 0
-    for update in updates:
-        if is_update_valid(rules, update):
+    for update, is_valid in checked_updates(compile_rules(rules), updates):
+        if is_valid:
             ans += update[len(update) // 2]
     return ans
 
@@ -182,6 +354,8 @@ def example1() -> None:
         result = solve(lines)
         print(f"'{text}' -> {result} (expected {expected})")
         assert result == expected
+        # reading the file instead, with the updates split over three batches
+        assert solve_stream(io.StringIO("\n".join(lines)), batch_size=2)[0] == expected
     print("= " * 32)
 
 def part1(lines: Lines) -> None:
@@ -202,6 +376,24 @@ def example2() -> None:
         result = solve2(lines)
         print(f"'{text}' -> {result} (expected {expected})")
         assert result == expected
+
+        # the same totals kept up to date while rules change
+        rules, updates = parse_input(lines)
+        book = RuleBook(rules, updates)
+        totals = (solve(lines), expected)
+        assert (book.total, book.total2) == totals
+        fresh = RuleBook({**book.rules, 29: book.rules[29] - {13}}, updates)
+        assert book.remove_rule(29, 13) == (fresh.total, fresh.total2)
+        assert book.add_rule(29, 13) == totals
+        try:
+            book.add_rule(13, 97)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("rule closing a cycle was accepted")
+        assert (book.total, book.total2) == totals
+        assert 97 not in book.rules.get(13, ())
+        assert solve_stream(io.StringIO("\n".join(lines)), batch_size=4) == totals
     print("= " * 32)
 
 def part2(lines: Lines) -> None:
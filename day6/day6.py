@@ -7,10 +7,14 @@ from pathlib import Path
 from collections import defaultdict
 from dataclasses import dataclass
 from pprint import pprint
-from copy import deepcopy
-
 import math
+import multiprocessing
+import random
 import re
+import sys
+import time
+
+import numpy as np
 
 INPUTFILE = "input.txt"
 
@@ -85,28 +89,61 @@ def parse_sections(lines: Lines) -> Sections:
 
 
 # Solution
-def find_guard(lines):
-    for i in range(len(lines)):
-        for j in range(len(lines[0])):
-            if lines[i][j]== "^":
-                return (i,j)
-    return -1
-
-def is_loop(lines):
-    x, y = find_guard(lines)
-
+OBSTACLE = ord('#')
+EMPTY = ord('.')
+
+@dataclass
+class Grid:
+    """The map as one row-major bytearray, so a boulder can be placed and
+    removed again without copying any rows."""
+    height: int
+    width: int
+    cells: bytearray
+
+    @classmethod
+    def from_lines(cls, lines: Lines) -> "Grid":
+        return cls(len(lines), len(lines[0]), bytearray("".join(lines), "ascii"))
+
+    @property
+    def array(self):
+        """The cells as a (height, width) uint8 array sharing this grid's memory."""
+        return np.frombuffer(self.cells, dtype=np.uint8).reshape(self.height, self.width)
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.height and 0 <= y < self.width
+
+    def is_obstacle(self, x, y):
+        return self.cells[x * self.width + y] == OBSTACLE
+
+    def toggle(self, x, y):
+        """Add an obstacle at (x, y), or remove it if there already is one."""
+        pos = x * self.width + y
+        self.cells[pos] = EMPTY if self.cells[pos] == OBSTACLE else OBSTACLE
+
+def find_guard(grid):
+    pos = grid.cells.find(b"^")
+    if pos < 0:
+        return -1
+    return divmod(pos, grid.width)
+
+MAX_STEPS = 10000
+
+def is_loop_capped(grid, start):
+    """The original loop check: walk cell by cell and assume a loop if the
+    guard is still on the grid after MAX_STEPS steps. Only kept around for
+    the benchmark."""
+    x, y = start
     curr_dir = 0 # start going up
-    delta_x, delta_y = DIRECTIONS[curr_dir] 
-    
-    ans = 0
+    delta_x, delta_y = DIRECTIONS[curr_dir]
+
     i = 0
-    while i < 10000:
+    while i < MAX_STEPS:
         new_x = x + delta_x
         new_y = y + delta_y
 
-        if not (0 <= new_x < len(lines) and 0 <= new_y < len(lines[0])):
+        if not grid.in_bounds(new_x, new_y):
             return False
-        elif lines[new_x][new_y] == '#':
+        elif grid.is_obstacle(new_x, new_y):
             curr_dir = (curr_dir + 1) % 4
         else:
             x = new_x
@@ -116,68 +153,201 @@ def is_loop(lines):
 
     return True
 
-DIRECTIONS = [
-    (-1, 0), # UP 
-    (0, 1),  # RIGHT
-    (1, 0),  # DOWN 
-    (0, -1)  # LEFT
-]
-def solve2(lines: Lines) -> int:
-    """Solve the problem."""
-    # first pop seen to get list of possible boulder spots
-    x, y = find_guard(lines)
+def walk_is_loop(grid, start, visited, curr_dir=0):
+    """Cell-by-cell version of is_loop, working on the grid itself."""
+    x, y = start
+    delta_x, delta_y = DIRECTIONS[curr_dir]
 
-    curr_dir = 0 # start going up
-    delta_x, delta_y = DIRECTIONS[curr_dir] 
-    
-    ans = 0
-    seen = {(x,y)}
+    touched = []
+    looped = False
     while True:
         new_x = x + delta_x
         new_y = y + delta_y
 
-        if not (0 <= new_x < len(lines) and 0 <= new_y < len(lines[0])):
+        if not grid.in_bounds(new_x, new_y):
             break
-        elif lines[new_x][new_y] == '#':
+        elif grid.is_obstacle(new_x, new_y):
             curr_dir = (curr_dir + 1) % 4
+            state = (x * grid.width + y) * 4 + curr_dir
+            if visited[state]:
+                looped = True
+                break
+            visited[state] = 1
+            touched.append(state)
         else:
             x = new_x
             y = new_y
-            seen.add((x,y))
         delta_x, delta_y = DIRECTIONS[curr_dir]
 
-    seen.remove(find_guard(lines)) # starting pos cannot be boulder
-    for boulder in seen:
-        copy_lines = deepcopy(lines)
-        boulder_x, boulder_y = boulder
-        line_str = copy_lines[boulder_x]
-        copy_lines[boulder_x] = line_str[:boulder_y] + '#' + line_str[boulder_y+1:]
-        if is_loop(copy_lines):
+    for state in touched:
+        visited[state] = 0
+    return looped
+
+def build_jumps(grid):
+    """For every cell and direction, find the cell where the guard stops
+    in front of the next obstacle. Returns a (4, height * width) array indexed
+    by direction and row-major cell (x * width + y); -1 means the guard walks
+    off the grid."""
+    height, width = grid.height, grid.width
+    dtype = np.int32 if 4 * height * width < 2**31 else np.int64
+    blocked = grid.array == OBSTACLE
+    rows = np.arange(height, dtype=dtype)[:, None]
+    cols = np.arange(width, dtype=dtype)[None, :]
+
+    # nearest obstacle in each direction, scanned along the rows and columns
+    above = np.maximum.accumulate(np.where(blocked, rows, -1), axis=0)
+    below = np.minimum.accumulate(np.where(blocked, rows, height)[::-1], axis=0)[::-1]
+    left = np.maximum.accumulate(np.where(blocked, cols, -1), axis=1)
+    right = np.minimum.accumulate(np.where(blocked, cols, width)[:, ::-1], axis=1)[:, ::-1]
+
+    jumps = np.empty((4, height, width), dtype=dtype)
+    jumps[0] = np.where(above >= 0, (above + 1) * width + cols, -1)
+    jumps[1] = np.where(right < width, rows * width + right - 1, -1)
+    jumps[2] = np.where(below < height, (below - 1) * width + cols, -1)
+    jumps[3] = np.where(left >= 0, rows * width + left + 1, -1)
+    return jumps.reshape(4, height * width)
+
+def patrol(grid, jumps):
+    """Walk the guard off the grid, one jump per turn. Returns a mask of the
+    visited cells, plus the candidate boulders: (cell, prev, prev_dir) for every
+    visited cell but the start, where (prev, prev_dir) is the guard's state just
+    before it first stepped onto that cell."""
+    height, width = grid.height, grid.width
+    steps = [dx * width + dy for dx, dy in DIRECTIONS]
+    visited = np.zeros(height * width, dtype=bool)
+
+    x, y = find_guard(grid)
+    pos = x * width + y
+    curr_dir = 0 # start going up
+    visited[pos] = True
+
+    new_cells = []
+    new_dirs = []
+    while True:
+        stop = jumps.item(curr_dir, pos)
+        step = steps[curr_dir]
+        if stop < 0:
+            # walk to the edge of the grid
+            x, y = divmod(pos, width)
+            end = [y, x * width + width - 1, (height - 1) * width + y, x * width][curr_dir]
+        else:
+            end = stop
+        segment = np.arange(pos + step, end + step, step)
+        new = segment[~visited[segment]]
+        new_cells.append(new)
+        new_dirs.append(np.full(len(new), curr_dir))
+        visited[segment] = True
+        if stop < 0:
+            break
+        pos = stop
+        curr_dir = (curr_dir + 1) % 4
+
+    cells = np.concatenate(new_cells)
+    prev = cells - np.array(steps)[np.concatenate(new_dirs)]
+    candidates = list(zip(
+        zip(*np.divmod(cells, width)),
+        zip(*np.divmod(prev, width)),
+        np.concatenate(new_dirs).tolist(),
+    ))
+    return visited, candidates
+
+def next_stop(jumps, width, pos, curr_dir, boulder):
+    """Jump from pos to the next turn, stopping early if the extra boulder
+    sits between pos and the obstacle from the table."""
+    stop = jumps.item(curr_dir, pos)
+    x, y = divmod(pos, width)
+    boulder_x, boulder_y = boulder
+    if curr_dir == 0:
+        if boulder_y == y and boulder_x < x and (stop < 0 or boulder_x >= stop // width):
+            return (boulder_x + 1) * width + y
+    elif curr_dir == 1:
+        if boulder_x == x and boulder_y > y and (stop < 0 or boulder_y <= stop % width):
+            return x * width + boulder_y - 1
+    elif curr_dir == 2:
+        if boulder_y == y and boulder_x > x and (stop < 0 or boulder_x <= stop // width):
+            return (boulder_x - 1) * width + y
+    else:
+        if boulder_x == x and boulder_y < y and (stop < 0 or boulder_y >= stop % width):
+            return x * width + boulder_y + 1
+    return stop
+
+def is_loop(jumps, width, start, boulder, visited, curr_dir=0):
+    """The guard is in a loop as soon as it turns at the same (position,
+    direction) twice. visited is a bytearray with one entry per turn state
+    (4 per cell); it is cleared again before returning so it can be reused."""
+    x, y = start
+    pos = x * width + y
+
+    touched = []
+    looped = False
+    while True:
+        pos = next_stop(jumps, width, pos, curr_dir, boulder)
+        if pos < 0:
+            break
+        curr_dir = (curr_dir + 1) % 4
+        state = pos * 4 + curr_dir
+        if visited[state]:
+            looped = True
+            break
+        visited[state] = 1
+        touched.append(state)
+
+    for state in touched:
+        visited[state] = 0
+    return looped
+
+DIRECTIONS = [
+    (-1, 0), # UP 
+    (0, 1),  # RIGHT
+    (1, 0),  # DOWN 
+    (0, -1)  # LEFT
+]
+def count_loops(jumps, width, candidates):
+    """Count the (boulder, prev, prev_dir) candidates that trap the guard."""
+    visited = bytearray(jumps.size)
+    ans = 0
+    for boulder, prev, prev_dir in candidates:
+        # the path up to prev is unchanged by the boulder, so resume from there
+        if is_loop(jumps, width, prev, boulder, visited, prev_dir):
             ans += 1
+    return ans
+
+worker_state = None
+
+def init_worker(jumps, width):
+    global worker_state
+    worker_state = (jumps, width)
+
+def count_loops_worker(candidates):
+    jumps, width = worker_state
+    return count_loops(jumps, width, candidates)
+
+def solve2(lines: Lines, workers: int = 1) -> int:
+    """Solve the problem. With workers > 1 the candidate boulders are checked
+    in a process pool."""
+    grid = Grid.from_lines(lines)
+    jumps = build_jumps(grid)
+    # every cell on the original path is a possible boulder spot, checked from
+    # the state the guard was in just before it first stepped onto it
+    _, candidates = patrol(grid, jumps)
+
+    width = grid.width
+    if workers <= 1:
+        return count_loops(jumps, width, candidates)
+
+    # the jump table is sent to each worker once; tasks are just coordinates
+    chunk_size = max(1, len(candidates) // (workers * 8))
+    chunks = [candidates[i:i + chunk_size] for i in range(0, len(candidates), chunk_size)]
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(jumps, width)) as pool:
+        ans = sum(pool.map(count_loops_worker, chunks))
 
     return ans
 
 def solve(lines: Lines) -> int:
     """Solve the problem."""
-    x,y = find_guard(lines)
-    seen = {(x,y)}
-    curr_dir = 0 # start going up
-    delta_x, delta_y = DIRECTIONS[curr_dir] 
-    while True:
-        new_x = x + delta_x
-        new_y = y + delta_y
-
-        if not (0 <= new_x < len(lines) and 0 <= new_y < len(lines[0])):
-            break
-        elif lines[new_x][new_y] == '#':
-            curr_dir = (curr_dir + 1) % 4
-        else:
-            x = new_x
-            y = new_y
-            seen.add((x,y))
-        delta_x, delta_y = DIRECTIONS[curr_dir]
-
-    return len(seen)
+    grid = Grid.from_lines(lines)
+    visited, _ = patrol(grid, build_jumps(grid))
+    return int(visited.sum())
 
 
 # PART 1
@@ -220,7 +390,76 @@ def part2(lines: Lines) -> None:
     print("= " * 32)
 
 
+# BENCHMARK
+
+def random_grid(size: int, density: float = 0.02, seed: int = 0) -> Lines:
+    """Generate a size x size grid with random obstacles and the guard in the
+    middle, retrying with the next seed until the guard can leave the grid."""
+    rng = np.random.default_rng(seed)
+    start = (size // 2, size // 2)
+    while True:
+        cells = np.where(rng.random((size, size)) < density, OBSTACLE, EMPTY).astype(np.uint8)
+        cells[start] = ord("^")
+        grid = Grid(size, size, bytearray(cells.tobytes()))
+        visited = bytearray(4 * size * size)
+        if not is_loop(build_jumps(grid), size, start, (-1, -1), visited):
+            return [row.tobytes().decode() for row in cells]
+
+def benchmark() -> None:
+    print("BENCHMARK:")
+    rng = random.Random(0)
+    for name, lines in [("input", load_input(INPUTFILE)), ("random 400", random_grid(400))]:
+        grid = Grid.from_lines(lines)
+        start = find_guard(grid)
+        width = grid.width
+        jumps = build_jumps(grid)
+        visited = bytearray(4 * grid.height * width)
+        candidates = rng.sample([
+            (x, y) for x in range(grid.height) for y in range(width)
+            if lines[x][y] == "."
+        ], 2000)
+
+        t0 = time.perf_counter()
+        capped = 0
+        for boulder in candidates:
+            grid.toggle(*boulder)
+            capped += is_loop_capped(grid, start)
+            grid.toggle(*boulder)
+        t1 = time.perf_counter()
+        exact = sum(is_loop(jumps, width, start, b, visited) for b in candidates)
+        t2 = time.perf_counter()
+        stepwise = 0
+        for boulder in candidates:
+            grid.toggle(*boulder)
+            stepwise += walk_is_loop(grid, start, visited)
+            grid.toggle(*boulder)
+        t3 = time.perf_counter()
+        print(f"{name}: {len(candidates)} candidates, "
+              f"capped {t1 - t0:.3f}s ({capped} loops), "
+              f"visited states {t2 - t1:.3f}s ({exact} loops), "
+              f"cell by cell {t3 - t2:.3f}s ({stepwise} loops)")
+
+    for size in [130, 500, 1000, 2000, 5000]:
+        # thin the obstacles out on bigger grids, or the guard rarely escapes
+        lines = random_grid(size, density=min(0.02, 10 / size))
+        t0 = time.perf_counter()
+        grid = Grid.from_lines(lines)
+        jumps = build_jumps(grid)
+        t1 = time.perf_counter()
+        visited, candidates = patrol(grid, jumps)
+        t2 = time.perf_counter()
+        loops = count_loops(jumps, size, candidates)
+        t3 = time.perf_counter()
+        print(f"{size}x{size}: jump table {t1 - t0:.3f}s, "
+              f"part 1 patrol {t2 - t1:.3f}s ({int(visited.sum())} cells), "
+              f"part 2 loops {t3 - t2:.3f}s ({loops} loops)")
+    print("= " * 32)
+
+
 if __name__ == "__main__":
+    if "--bench" in sys.argv:
+        benchmark()
+        sys.exit(0)
     example1()
     input_lines = load_input(INPUTFILE)
     part1(input_lines)
@@ -2,13 +2,17 @@
 #
 #  Advent of Code 2024 - Day 7
 #
-from typing import Sequence, Union, Optional, Any, Dict, List, Tuple
+from typing import Sequence, Union, Optional, Any, Dict, List, Tuple, Callable
 from pathlib import Path
 from collections import defaultdict
 from dataclasses import dataclass
 from pprint import pprint
+import functools
 import math
+import multiprocessing
 import re
+import sys
+import time
 
 INPUTFILE = "input.txt"
 
@@ -86,9 +90,16 @@ def parse_equations(lines):
     for line in lines:
         LHS = int(line.split(':')[0])
         RHS = [int(param) for param in line.split(':')[1].strip().split()]
+        check_operands(RHS)
         new_lines.append((LHS, RHS))
     return new_lines
 
+def check_operands(RHS):
+    """The solvers start from RHS[0] and rely on the value never going
+    negative, so negative operands are rejected up front. Zero is fine."""
+    if not RHS or min(RHS) < 0:
+        raise ValueError(f"operands must be non-negative integers: {RHS}")
+
 def equation_possible(LHS, RHS, acc):
     if not RHS:
         if acc == LHS:
@@ -114,24 +125,156 @@ def equation_possible_with_concat(LHS, RHS, acc):
         return add_possible or mult_possible or concat_possible
     return False
 
-def solve2(lines: Lines) -> int:
-    """Solve the problem."""
-    lines = parse_equations(lines)
+def digit_shifts(RHS):
+    """10 ** (number of digits) for each operand, so a || b == a * shift + b."""
+    return [10 ** len(str(param)) for param in RHS]
+
+def equation_possible_forward(LHS, RHS, shifts, i, acc, concat=False):
+    """Index-based version of equation_possible(_with_concat), starting from
+    acc = RHS[0], i = 1. With positive operands no operator makes acc smaller,
+    so a branch is dropped as soon as acc overshoots LHS; a 0 operand can
+    bring it back down (acc * 0), so then every branch is followed."""
+    if acc > LHS and 0 not in RHS:
+        return False
+    if i == len(RHS):
+        return acc == LHS
+    curr_param = RHS[i]
+    if equation_possible_forward(LHS, RHS, shifts, i + 1, acc + curr_param, concat):
+        return True
+    if equation_possible_forward(LHS, RHS, shifts, i + 1, acc * curr_param, concat):
+        return True
+    if concat:
+        return equation_possible_forward(LHS, RHS, shifts, i + 1, acc * shifts[i] + curr_param, concat)
+    return False
+
+@dataclass(frozen=True)
+class Operator:
+    """An operator the solver can place between two operands. The solver
+    works backwards from LHS, so it only needs to know how to undo the
+    operator: can_undo(target, b) says whether target could be acc OP b for
+    some valid acc, and inverse(target, b) gives that acc, or None if any
+    acc would do (as for target = acc * 0). An operator
+    without a can_undo hook is always tried, and the search then memoizes
+    its subproblems since they are no longer pruned away."""
+    symbol: str
+    inverse: Callable[[int, int], int]
+    can_undo: Optional[Callable[[int, int], bool]] = None
+
+def concat_shift(b):
+    return 10 ** len(str(b))
+
+def undo_add(target, b):
+    return target - b
+
+def can_undo_add(target, b):
+    return target >= b
+
+def undo_mult(target, b):
+    # acc * 0 is 0 whatever acc is
+    return target // b if b else None
+
+def can_undo_mult(target, b):
+    return target % b == 0 if b else target == 0
+
+def undo_concat(target, b):
+    return target // concat_shift(b)
+
+def can_undo_concat(target, b):
+    # b's digits must be a suffix of target
+    return target % concat_shift(b) == b
+
+OPERATORS = {}
+
+def register_operator(operator: Operator) -> None:
+    """Make an operator available by its symbol through get_operators."""
+    OPERATORS[operator.symbol] = operator
+
+def get_operators(*symbols: str) -> Tuple[Operator, ...]:
+    """Look up registered operators. The Operator objects themselves are what
+    gets passed around (including to pool workers, so their hooks must be
+    module-level functions), so workers don't need their own registry."""
+    return tuple(OPERATORS[symbol] for symbol in symbols)
+
+register_operator(Operator("+", undo_add, can_undo_add))
+register_operator(Operator("*", undo_mult, can_undo_mult))
+register_operator(Operator("||", undo_concat, can_undo_concat))
+
+PART1_OPERATORS = get_operators("+", "*")
+PART2_OPERATORS = get_operators("+", "*", "||")
+
+def reachable(RHS, i, target, operators, memo=None):
+    """Can RHS[:i+1] evaluate to target? Works back from target, undoing
+    one operator per operand. memo, if given, caches (i, target)."""
+    if memo is not None:
+        key = (i, target)
+        if key in memo:
+            return memo[key]
+    curr_param = RHS[i]
+    if i == 0:
+        result = target == curr_param
+    else:
+        result = False
+        for op in operators:
+            if op.can_undo is not None and not op.can_undo(target, curr_param):
+                continue
+            prev = op.inverse(target, curr_param)
+            # None: any value of RHS[:i] works, and it always has one
+            if prev is None or reachable(RHS, i - 1, prev, operators, memo):
+                result = True
+                break
+    if memo is not None:
+        memo[key] = result
+    return result
+
+@dataclass
+class Equation:
+    LHS: int
+    RHS: List[int]
+
+    def __post_init__(self):
+        check_operands(self.RHS)
+
+    def possible(self, operators: Sequence[Operator]) -> bool:
+        """Can the operators make RHS evaluate to LHS? Subproblems are only
+        memoized when some operator has no pruning hook; with pruning they
+        almost never repeat and the cache just costs time."""
+        memo = {} if any(op.can_undo is None for op in operators) else None
+        return reachable(self.RHS, len(self.RHS) - 1, self.LHS, operators, memo)
+
+def sum_possible(equations, operators):
     ans = 0
-    for LHS, RHS in lines:
-        if equation_possible_with_concat(LHS, RHS, 0):
+    for LHS, RHS in equations:
+        if Equation(LHS, RHS).possible(operators):
             ans += LHS
     return ans
 
+def equation_cost(RHS, operators):
+    """Number of operator combinations for an equation. This is the cost of
+    an exhaustive search, and only an upper bound for the pruned backward
+    search the workers run, which usually stops after a few branches; it
+    just keeps the equations that could be expensive from piling up."""
+    return len(operators) ** (len(RHS) - 1)
+
+def sum_possible_parallel(equations, operators, workers=1):
+    """Split the equations into chunks and check them in a process pool.
+    The equations are sorted by equation_cost and dealt out round-robin, so
+    every chunk gets a similar mix of long and short ones."""
+    if workers <= 1:
+        return sum_possible(equations, operators)
+    ordered = sorted(equations, key=lambda eq: equation_cost(eq[1], operators), reverse=True)
+    num_chunks = min(len(ordered), workers * 8) or 1
+    chunks = [ordered[i::num_chunks] for i in range(num_chunks)]
+    with multiprocessing.Pool(workers) as pool:
+        return sum(pool.imap_unordered(functools.partial(sum_possible, operators=operators), chunks))
 
-def solve(lines: Lines) -> int:
+def solve2(lines: Lines, workers: int = 1) -> int:
     """Solve the problem."""
-    lines = parse_equations(lines)
-    ans = 0
-    for LHS, RHS in lines:
-        if equation_possible(LHS, RHS, 0):
-            ans += LHS
-    return ans
+    return sum_possible_parallel(parse_equations(lines), PART2_OPERATORS, workers=workers)
+
+
+def solve(lines: Lines, workers: int = 1) -> int:
+    """Solve the problem."""
+    return sum_possible_parallel(parse_equations(lines), PART1_OPERATORS, workers=workers)
 
 
 # PART 1
@@ -174,7 +317,33 @@ def part2(lines: Lines) -> None:
     print("= " * 32)
 
 
+# BENCHMARK
+
+def benchmark() -> None:
+    print("BENCHMARK:")
+    equations = parse_equations(load_input(INPUTFILE))[:100]
+    checks = [
+        ("slicing", lambda LHS, RHS: equation_possible(LHS, RHS, 0),
+                    lambda LHS, RHS: equation_possible_with_concat(LHS, RHS, 0)),
+        ("forward", lambda LHS, RHS: equation_possible_forward(LHS, RHS, digit_shifts(RHS), 1, RHS[0]),
+                    lambda LHS, RHS: equation_possible_forward(LHS, RHS, digit_shifts(RHS), 1, RHS[0], True)),
+        ("Equation", lambda LHS, RHS: Equation(LHS, RHS).possible(PART1_OPERATORS),
+                     lambda LHS, RHS: Equation(LHS, RHS).possible(PART2_OPERATORS)),
+    ]
+    for name, check, check_concat in checks:
+        t0 = time.perf_counter()
+        ans = sum(LHS for LHS, RHS in equations if check(LHS, RHS))
+        t1 = time.perf_counter()
+        ans2 = sum(LHS for LHS, RHS in equations if check_concat(LHS, RHS))
+        t2 = time.perf_counter()
+        print(f"{name}: part 1 {t1 - t0:.3f}s ({ans}), part 2 {t2 - t1:.3f}s ({ans2})")
+    print("= " * 32)
+
+
 if __name__ == "__main__":
+    if "--bench" in sys.argv:
+        benchmark()
+        sys.exit(0)
     example1()
     input_lines = load_input(INPUTFILE)
     part1(input_lines)